@@ -63,6 +63,19 @@ if MODELS_OLLAMA != []:
 if MODELS_VLLM != []:
     AVAILABLE_LLM_MODELS += MODELS_VLLM
 
+# Provider -> (models, litellm prefix) - static per process, so resolved once instead of on every rerun
+MODEL_PROVIDERS = {
+    provider: config
+    for provider, config in {
+        "Ollama": (MODELS_OLLAMA, "ollama/"),
+        "Gemini": (MODELS_GEMINI, "gemini/"),
+        "OpenAI": (MODELS_OPENAI, "openai/"),
+        "VLLM": (MODELS_VLLM, "hosted_vllm/"),
+        "ExLlama": (MODELS_EXLLAMA, "openai/"),  # TabbyAPI uses OpenAI-convention
+    }.items()
+    if config[0] != []
+}
+
 AVAILABLE_PROMPTS = {
     "Quick Overview": SYS_QUICK_OVERVIEW,
     "Code Assistant": SYS_CODE_OPERATOR,
@@ -102,33 +115,14 @@ def init_session_state() -> None:
 
 def model_selector(key: str) -> dict:
     """Create model selection dropdowns in Streamlit sidebar expanders."""
-    model_options = []
-    model_configs = {}
-
-    if MODELS_OLLAMA != []:
-        model_options.append("Ollama")
-        model_configs["Ollama"] = (MODELS_OLLAMA, "ollama/")
-    if MODELS_GEMINI != []:
-        model_options.append("Gemini")
-        model_configs["Gemini"] = (MODELS_GEMINI, "gemini/")
-    if MODELS_OPENAI != []:
-        model_options.append("OpenAI")
-        model_configs["OpenAI"] = (MODELS_OPENAI, "openai/")
-    if MODELS_VLLM != []:
-        model_options.append("VLLM")
-        model_configs["VLLM"] = (MODELS_VLLM, "hosted_vllm/")
-    if MODELS_EXLLAMA != []:
-        model_options.append("ExLlama")
-        model_configs["ExLlama"] = (MODELS_EXLLAMA, "openai/")  # TabbyAPI uses OpenAI-convention
-
     selected_provider = st.radio(
         label="Model Provider",
-        options=model_options,
+        options=list(MODEL_PROVIDERS.keys()),
         index=0,
         horizontal=True,
         key=f"model_provider_radio_{key}",
     )
-    models_list, litellm_prefix = model_configs[selected_provider]
+    models_list, litellm_prefix = MODEL_PROVIDERS[selected_provider]
 
     return st.selectbox(
         label=f"Models ({selected_provider})",
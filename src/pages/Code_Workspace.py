@@ -1,11 +1,14 @@
 """Streamlit tab to tokenize codebases into chunks."""
 
 import ast
-from itertools import cycle
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import math
+import os
 from pathlib import Path
 import subprocess
-from typing import Iterable
+from typing import Sequence
+import zlib
 
 import networkx as nx
 import polars as pl
@@ -21,7 +24,24 @@ class DatabaseKeysExt(DatabaseKeys):
     KEY_CALLED_BY = "called_by"
     KEY_MODULE = "module"
 
-def render_call_relations(df: pl.DataFrame, idx: int) -> None:
+
+GRAPH_PALETTE = [
+    "#ff6b6b",
+    "#ffd93d",
+    "#6bcb77",
+    "#4d96ff",
+    "#f06595",
+    "#f8961e",
+]
+
+
+# (repo path, HEAD SHA, per-file mtimes) - identifies one build of the chunk frame
+ChunksKey = tuple[str, str, tuple[tuple[str, int], ...]]
+# (chunk frame, title -> row index, frame key) - resolved once per run & shared by tokenizer and graph view
+CodeChunks = tuple[pl.DataFrame, dict[str, int], ChunksKey]
+
+
+def render_call_relations(df: pl.DataFrame, idx: int, name_to_row_index: dict[str, int]) -> None:
     """
     Render expandable sections for the selected chunk's custom calls
     and the chunks that call it (called_by). Each related chunk can
@@ -32,17 +52,16 @@ def render_call_relations(df: pl.DataFrame, idx: int) -> None:
         return
 
     row = df.row(idx, named=True)
-    name_to_row_index: dict[str, int] = {df.row(i, named=True)[DatabaseKeysExt.KEY_TITLE]: i for i in range(df.height)}
 
-    def _render_group(title: str, names: Iterable[str]) -> None:
-        with st.expander(f"{title} ({len(list(names))})", expanded=False):
-            for n in sorted(set(names)):
+    def _render_group(title: str, names: Sequence[str]) -> None:
+        unique = sorted(set(names))
+        with st.expander(f"{title} ({len(unique)})", expanded=False):
+            for n in unique:
                 if n in name_to_row_index:
                     r_idx = name_to_row_index[n]
-                    r = df.row(r_idx, named=True)
-                    with st.expander(f"{r['kind']} {n}", expanded=False):
-                        st.code(r[DatabaseKeysExt.KEY_TXT_RETRIEVAL])
-                        st.caption(f"Module: {r[DatabaseKeysExt.KEY_MODULE]}")
+                    with st.expander(f"{df['kind'][r_idx]} {n}", expanded=False):
+                        st.code(df[DatabaseKeysExt.KEY_TXT_RETRIEVAL][r_idx])
+                        st.caption(f"Module: {df[DatabaseKeysExt.KEY_MODULE][r_idx]}")
                 else:
                     st.write(f"{n} (not found)")
 
@@ -50,21 +69,25 @@ def render_call_relations(df: pl.DataFrame, idx: int) -> None:
     _render_group("Called by", row[DatabaseKeysExt.KEY_CALLED_BY])
 
 
-def _list_python_files(repo_path: Path) -> list[Path]:
-    """List Python files not ignored by .gitignore in *repo_path*."""
-    tracked = subprocess.run(["git", "ls-files"], capture_output=True, text=True, cwd=repo_path, check=True).stdout.splitlines()
-    all_files = {Path(f) for f in tracked}
-    return [repo_path / f for f in all_files if f.suffix == ".py" and f != "config.py"]
+@st.cache_data(show_spinner=False, max_entries=32)
+def _list_python_files(repo_path: Path, head_sha: str, index_mtime_ns: int) -> tuple[Path, ...]:  # noqa: ARG001
+    """
+    List tracked Python files in *repo_path*.
+    *head_sha* & *index_mtime_ns* only key the cache - commits, ``git add`` & ``git rm`` change one of them.
+    """
+    tracked = subprocess.run(
+        ["git", "ls-files", "-z", "--", "*.py"], capture_output=True, text=True, cwd=repo_path, check=True
+    ).stdout.split("\0")
+    return tuple(repo_path / f for f in tracked if f and f != "config.py")
 
 
 def _find_calls(node: ast.AST, custom_names: set[str]) -> list[str]:
     """Return names of custom functions/classes called within *node*."""
 
     calls: set[str] = set()
-
-    class Visitor(ast.NodeVisitor):
-        def visit_Call(self, call: ast.Call) -> None:  # noqa: N802 - ast naming
-            func = call.func
+    for child in ast.walk(node):
+        if isinstance(child, ast.Call):
+            func = child.func
             name = None
             if isinstance(func, ast.Name):
                 name = func.id
@@ -72,35 +95,72 @@ def _find_calls(node: ast.AST, custom_names: set[str]) -> list[str]:
                 name = func.attr
             if name and name in custom_names:
                 calls.add(name)
-            self.generic_visit(call)
-
-    Visitor().visit(node)
     return sorted(calls)
 
 
-def _build_dataframe(repo_path: Path) -> pl.DataFrame:
-    """Build a Polars DataFrame of code chunks for *repo_path* with call info."""
+def _index_full_names(df: pl.DataFrame) -> dict[str, list[str]]:
+    """Map each chunk title to the full names of all chunks sharing it (titles may repeat across modules)."""
+    title_to_full_names: dict[str, list[str]] = defaultdict(list)
+    for title, full_name in zip(df[DatabaseKeysExt.KEY_TITLE].to_list(), df["full_name"].to_list(), strict=True):
+        title_to_full_names[title].append(full_name)
+    return title_to_full_names
+
+
+def _call_edges(df: pl.DataFrame) -> list[tuple[str, str]]:
+    """Return (caller, callee) full name pairs - calls to names not defined in the repo yield no edge."""
+    title_to_full_names = _index_full_names(df)
+    return [
+        (src, target)
+        for src, callees in zip(df["full_name"].to_list(), df[DatabaseKeysExt.KEY_CALLS].to_list(), strict=True)
+        for callee in callees
+        for target in title_to_full_names.get(callee, ())
+    ]
+
 
-    files = _list_python_files(repo_path)
+def _palette_color(key: str) -> str:
+    """Pick a stable palette color for *key* - crc32 instead of hash(), which is salted per process."""
+    return GRAPH_PALETTE[zlib.crc32(key.encode()) % len(GRAPH_PALETTE)]
+
+
+def _line_offsets(text: str) -> list[int]:
+    """Return the character offset at which each line of *text* starts."""
+    offsets = [0]
+    pos = text.find("\n")
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = text.find("\n", pos + 1)
+    return offsets
+
+
+def _parse_file(file: Path) -> tuple[ast.Module, str]:
+    """Read & parse *file* - returns its syntax tree and source text."""
+    text = file.read_text()
+    return ast.parse(text), text
+
+
+def _build_dataframe(repo_path: Path, files: Sequence[Path]) -> pl.DataFrame:
+    """Build a Polars DataFrame of code chunks from the Python *files* of *repo_path* with call info."""
+
+    # Reads release the GIL - overlap file I/O of large repos across threads
+    with ThreadPoolExecutor(max_workers=min(32, len(files) or 1)) as executor:
+        parsed_files: dict[Path, tuple[ast.Module, str]] = dict(zip(files, executor.map(_parse_file, files), strict=True))
 
     # Gather names of custom classes and top-level functions in the repo
     custom_names: set[str] = set()
-    parsed_files: dict[Path, tuple[ast.Module, list[str]]] = {}
-    for file in files:
-        text = file.read_text()
-        tree = ast.parse(text)
-        parsed_files[file] = (tree, text.splitlines())
+    for tree, _ in parsed_files.values():
         for node in tree.body:
             if isinstance(node, (ast.ClassDef, ast.FunctionDef)):
                 custom_names.add(node.name)
 
     chunks: list[dict[str, object]] = []
-    for file, (tree, lines) in parsed_files.items():
+    for file, (tree, text) in parsed_files.items():
+        offsets = _line_offsets(text)
         for node in tree.body:
             if isinstance(node, (ast.ClassDef, ast.FunctionDef)):
                 start = node.lineno - 1
                 end = node.end_lineno
-                code = "\n".join(lines[start:end])
+                # Slice the source directly - drop the newline terminating the last line
+                code = text[offsets[start] : offsets[end] - 1] if end < len(offsets) else text[offsets[start] :]
                 module_path = file.relative_to(repo_path).with_suffix("")
                 module = ".".join(module_path.parts)
                 full_name = f"{module}.{node.name}"
@@ -144,13 +204,50 @@ def _build_dataframe(repo_path: Path) -> pl.DataFrame:
     )
 
 
-def render_codebase_tokenizer() -> None:
-    """Render the Codebase Tokenizer tab."""
+def _git_state(repo_path: Path) -> tuple[str, int]:
+    """Return the commit SHA checked out in *repo_path* & the mtime of its index, which staging rewrites."""
+    git_dir, head_sha = subprocess.run(
+        ["git", "rev-parse", "--absolute-git-dir", "HEAD"], capture_output=True, text=True, cwd=repo_path, check=True
+    ).stdout.splitlines()
+    index = Path(git_dir) / "index"
+    return head_sha, index.stat().st_mtime_ns if index.exists() else 0
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _build_dataframe_cached(
+    repo_path: str, head_sha: str, mtimes: tuple[tuple[str, int], ...]  # noqa: ARG001
+) -> tuple[pl.DataFrame, dict[str, int]]:
+    """
+    Memoize :func:`_build_dataframe` across reruns & sessions - *head_sha* only acts as cache key,
+    *mtimes* keys the cache & lists the files to parse.
+    Also returns the chunk title -> row index lookup used by :func:`render_call_relations`.
+    Cached as a shared resource (never mutated by callers) so reruns skip unpickling the frame - every saved
+    file yields a new key, *max_entries* bounds the frames kept alive.
+    """
+    df = _build_dataframe(Path(repo_path), [Path(f) for f, _ in mtimes])
+    return df, {title: i for i, title in enumerate(df[DatabaseKeysExt.KEY_TITLE].to_list())}
+
+
+def _load_code_chunks(repo_path: Path) -> CodeChunks:
+    """
+    Return the code chunks of *repo_path* & their title index, rebuilt only after new commits or file modifications.
+    Also returns the cache key identifying this chunk frame - state derived from the frame must be keyed on it.
+    """
+    head_sha, index_mtime_ns = _git_state(repo_path)
+    files = _list_python_files(repo_path, head_sha, index_mtime_ns)
+    mtimes = tuple(sorted((str(f), f.stat().st_mtime_ns) for f in files))
+    df, name_to_row_index = _build_dataframe_cached(str(repo_path), head_sha, mtimes)
+    return df, name_to_row_index, (str(repo_path), head_sha, mtimes)
+
+
+def render_codebase_tokenizer() -> CodeChunks | None:
+    """Render the Codebase Tokenizer tab - returns the loaded chunks of the selected repo for the graph view."""
     st.subheader("Codebase Tokenizer")
 
     def _find_git_repos(base: Path) -> list[Path]:
         """Return directories in *base* that contain a .git folder."""
-        return [p for p in base.iterdir() if (p / ".git").exists() and p.is_dir()]
+        with os.scandir(base) as entries:
+            return [Path(e.path) for e in entries if e.is_dir() and os.path.exists(os.path.join(e.path, ".git"))]
 
     repos = _find_git_repos(Path.home())
     if repos:
@@ -171,78 +268,68 @@ def render_codebase_tokenizer() -> None:
     repo_path_str = st.session_state.get("selected_repo")
     if not repo_path_str:
         st.info("Select a repository from the sidebar.")
-        return
+        return None
     repo = Path(repo_path_str)
 
-    if "code_chunks_repo" not in st.session_state or st.session_state.code_chunks_repo != str(repo):
-        st.session_state.code_chunks = _build_dataframe(repo)
-        st.session_state.code_chunks_repo = str(repo)
-
-    df = st.session_state.code_chunks
+    chunks = _load_code_chunks(repo)
+    df, name_to_row_index, _ = chunks
     display_df = df.select(
         [DatabaseKeysExt.KEY_MODULE, DatabaseKeysExt.KEY_TITLE, "docstring", DatabaseKeysExt.KEY_CALLS, DatabaseKeysExt.KEY_CALLED_BY, "loc"]
     )
-    st.dataframe(display_df.to_pandas())
+    st.dataframe(display_df)
 
     with st.expander("Display chunk by index"):
         if df.height:
             idx = st.number_input("Chunk index", min_value=0, max_value=df.height - 1, step=1)
-            render_call_relations(df, idx)
+            render_call_relations(df, idx, name_to_row_index)
             st.code(df[idx, DatabaseKeysExt.KEY_TXT_RETRIEVAL])
 
+    return chunks
+
 
-def render_code_graph() -> None:
-    """Render a graph view of the codebase using agraph."""
+def render_code_graph(chunks: CodeChunks | None) -> None:
+    """Render a graph view of the codebase using agraph - *chunks* as loaded by :func:`render_codebase_tokenizer`."""
 
     st.markdown("<h1 class='graph-title'>Codebase Graph</h1>", unsafe_allow_html=True)
 
-    repo_path_str = st.session_state.get("selected_repo")
-    if not repo_path_str:
+    if chunks is None:
         st.markdown(
             "<div class='graph-card'><h2>No repo selected</h2><p>Select a repository from the sidebar to see the graph.</p></div>",
             unsafe_allow_html=True,
         )
         return
-    repo = Path(repo_path_str)
-
-    if "code_chunks_repo" not in st.session_state or st.session_state.code_chunks_repo != str(repo):
-        st.session_state.code_chunks = _build_dataframe(repo)
-        st.session_state.code_chunks_repo = str(repo)
 
-    df = st.session_state.code_chunks
+    df, name_to_row_index, chunks_key = chunks
     graph_type = st.radio("Graph type", ["Hierarchy", "Louvain"], horizontal=True)
 
-    cache_key = (str(repo), graph_type)
-    cache = st.session_state.get("graph_cache")
-    needs_build = st.session_state.get("graph_cache_key") != cache_key
+    # Layer 1 (per chunk frame): graph, communities & edges - layer 2 (per graph type): colored nodes
+    # A rebuilt frame replaces layer 1 wholesale, which also drops the colored nodes of the old frame
+    needs_build = st.session_state.get("graph_cache_key") != chunks_key
     placeholder = st.empty()
 
     if needs_build:
+        call_edges = _call_edges(df)
         G = nx.DiGraph()
-        for row in df.iter_rows(named=True):
-            src = row["full_name"]
-            G.add_node(src)
-            for callee in row[DatabaseKeysExt.KEY_CALLS]:
-                for m in df.filter(pl.col(DatabaseKeysExt.KEY_TITLE) == callee).iter_rows(named=True):
-                    G.add_edge(src, m["full_name"])
+        G.add_nodes_from(df["full_name"].to_list())
+        G.add_edges_from(call_edges)
 
         communities = list(nx.algorithms.community.louvain_communities(G.to_undirected()))
-        community_map = {n: idx for idx, comm in enumerate(communities) for n in comm}
-
-        palette = [
-            "#ff6b6b",
-            "#ffd93d",
-            "#6bcb77",
-            "#4d96ff",
-            "#f06595",
-            "#f8961e",
-        ]
-        color_cycle = cycle(palette)
-        module_colors = {m: next(color_cycle) for m in df[DatabaseKeysExt.KEY_MODULE].unique().to_list()}
-        community_colors = {i: next(color_cycle) for i in range(len(communities))}
+        st.session_state.graph_cache = {
+            "community_map": {n: idx for idx, comm in enumerate(communities) for n in comm},
+            "n_communities": len(communities),
+            "edges": [Edge(source=src, target=target, color="rgba(255,255,255,0.25)", smooth=True) for src, target in call_edges],
+            "full_name_to_idx": {full_name: i for i, full_name in enumerate(df["full_name"].to_list())},
+            "nodes": {},
+        }
+        st.session_state.graph_cache_key = chunks_key
+
+    cache = st.session_state.graph_cache
+    if graph_type not in cache["nodes"]:
+        module_colors = {m: _palette_color(m) for m in df[DatabaseKeysExt.KEY_MODULE].unique().to_list()}
+        community_colors = {i: _palette_color(f"community:{i}") for i in range(cache["n_communities"])}
+        community_map = cache["community_map"]
 
         nodes: list[Node] = []
-        edges: list[Edge] = []
         for row in df.iter_rows(named=True):
             full_id = row["full_name"]
             color = (
@@ -263,28 +350,11 @@ def render_code_graph() -> None:
                     borderWidthSelected=3,
                 )
             )
-            for callee in row[DatabaseKeysExt.KEY_CALLS]:
-                for m in df.filter(pl.col(DatabaseKeysExt.KEY_TITLE) == callee).iter_rows(named=True):
-                    edges.append(
-                        Edge(
-                            source=full_id,
-                            target=m["full_name"],
-                            color="rgba(255,255,255,0.25)",
-                            smooth=True,
-                        )
-                    )
-
-        full_name_to_idx = {df.row(i, named=True)["full_name"]: i for i in range(df.height)}
-        st.session_state.graph_cache = {
-            "nodes": nodes,
-            "edges": edges,
-            "full_name_to_idx": full_name_to_idx,
-        }
-        st.session_state.graph_cache_key = cache_key
-    else:
-        nodes = cache["nodes"]  # type: ignore
-        edges = cache["edges"]  # type: ignore
-        full_name_to_idx = cache["full_name_to_idx"]  # type: ignore
+        cache["nodes"][graph_type] = nodes
+
+    nodes = cache["nodes"][graph_type]
+    edges = cache["edges"]
+    full_name_to_idx = cache["full_name_to_idx"]
 
     config = Config(
         width="100%",
@@ -308,12 +378,12 @@ def render_code_graph() -> None:
             st.write(f"**Name:** {d[DatabaseKeysExt.KEY_TITLE]}")
             st.write(f"Module: {d[DatabaseKeysExt.KEY_MODULE]}")
             st.write(f"LOC: {d['loc']}")
-            render_call_relations(df, idx)
+            render_call_relations(df, idx, name_to_row_index)
             st.code(d[DatabaseKeysExt.KEY_TXT_RETRIEVAL])
         else:
             st.write("Select a node to see details.")
 
 if __name__ == "__main__":
-    render_codebase_tokenizer()
+    code_chunks = render_codebase_tokenizer()
     st.markdown("---")
-    render_code_graph()
\ No newline at end of file
+    render_code_graph(code_chunks)
\ No newline at end of file
@@ -1,3 +1,4 @@
+from collections import defaultdict
 import json
 import os
 import pathlib
@@ -40,24 +41,26 @@ def init_session_state() -> None:
 
 
 # ---------------------------- Preprocessing Step 1 - Move Paths / Fix Headings / Adjust MD Image Paths ---------------------------- #
-def _transform_headings(lines: list[str]) -> list[str]:
+H1_PATTERN = re.compile(r"^# (.*)$", re.MULTILINE)  # used for rewriting VLM headings
+
+
+def _rewrite_heading(match: re.Match) -> str:
+    """Rewrites a single H1 heading match - see :func:`_transform_headings`."""
+    content = match.group(1).strip()
+    numeric_part = content.split(" ", 1)[0].rstrip(".")
+    if numeric_part.replace(".", "").isdigit():
+        level = numeric_part.count(".") + 1
+        return f"{'#' * min(level, 6)} {content}"
+    return f"**{content}**"
+
+
+def _transform_headings(content: str) -> str:
     """
     Rewrites markdown heading lines based on specific formatting rules.
     - Converts numeric-prefixed H1s (e.g., '# 1.2 Title') to their correct level ('## 1.2 Title').
     - Converts non-numeric H1s (e.g., '# Conclusion') to bolded text.
     """
-    processed = []
-    for line in lines:
-        if line.startswith("# "):
-            content = line[2:].strip()
-            numeric_part = content.split(" ", 1)[0].rstrip(".")
-            if numeric_part.replace(".", "").isdigit():
-                level = numeric_part.count(".") + 1
-                line = f"{'#' * min(level, 6)} {content}"
-            else:
-                line = f"**{content}**"
-        processed.append(line)
-    return processed
+    return H1_PATTERN.sub(_rewrite_heading, content)
 
 
 IMAGE_PATH_PATTERN_SERVER = re.compile(r"!\[(.*?)\]\(images/")  # used for mapping image paths to server URLs
@@ -85,8 +88,7 @@ def _preprocess_document(doc_id: str) -> None:
 
         content = dest_md_path.read_text(encoding="utf-8")
         content = IMAGE_PATH_PATTERN_SERVER.sub(rf"![\1]({server_img_url_path}/", content)
-        lines = _transform_headings(content.splitlines())
-        final_content = "\n".join(lines)
+        final_content = _transform_headings(content)
         dest_md_path.write_text(final_content, encoding="utf-8")
 
         if static_imgs_dest_path.is_dir():
@@ -335,6 +337,7 @@ METADATA_SCHEMA = {
 }
 
 DEFAULT_HEADING = "<None>"
+HEADING_PATTERN = re.compile(r"^(#{1,3}) (.*)$", re.MULTILINE)  # used for splitting markdown into H1/H2/H3 chunks
 
 
 def create_ingestion_payload(markdown_filepath: str) -> RAGIngestionPayload:
@@ -360,18 +363,16 @@ def create_ingestion_payload(markdown_filepath: str) -> RAGIngestionPayload:
     except FileNotFoundError:
         return RAGIngestionPayload.create_empty_payload()
 
-    lines = markdown_text.split("\n")
     chunks = []
-    current_buffer = []
 
     # State tracking for the current hierarchy
     current_h1 = DEFAULT_HEADING
     current_h2 = DEFAULT_HEADING
     current_h3 = DEFAULT_HEADING
 
-    def save_current_chunk() -> None:
-        """Saves the content in the buffer as a new chunk with current hierarchy."""
-        text_content = "\n".join(current_buffer).strip()
+    def save_current_chunk(text_content: str) -> None:
+        """Saves the text between two headings as a new chunk with current hierarchy."""
+        text_content = text_content.strip()
         if not text_content:
             return
 
@@ -408,26 +409,23 @@ def create_ingestion_payload(markdown_filepath: str) -> RAGIngestionPayload:
         }
         chunks.append(chunk_record)
 
-    for line in lines:
-        if line.startswith("# "):
-            save_current_chunk()
-            current_buffer = []
-            current_h1 = line[2:].strip()
+    # Slice the text between consecutive headings instead of buffering it line by line
+    chunk_start = 0
+    for match in HEADING_PATTERN.finditer(markdown_text):
+        save_current_chunk(markdown_text[chunk_start : match.start()])
+        chunk_start = match.end()
+        level, heading = len(match.group(1)), match.group(2).strip()
+        if level == 1:
+            current_h1 = heading
             current_h2 = DEFAULT_HEADING  # Reset sub-levels
             current_h3 = DEFAULT_HEADING
-        elif line.startswith("## "):
-            save_current_chunk()
-            current_buffer = []
-            current_h2 = line[3:].strip()
+        elif level == 2:
+            current_h2 = heading
             current_h3 = DEFAULT_HEADING  # Reset sub-level
-        elif line.startswith("### "):
-            save_current_chunk()
-            current_buffer = []
-            current_h3 = line[4:].strip()
         else:
-            current_buffer.append(line)
+            current_h3 = heading
 
-    save_current_chunk()  # Save the final chunk after the loop
+    save_current_chunk(markdown_text[chunk_start:])  # Save the final chunk after the last heading
 
     if not chunks:
         return RAGIngestionPayload.create_empty_payload()
@@ -461,8 +459,10 @@ def render_chunks(output_name: str) -> None:
 
         # Parse metadata to determine hierarchy levels
         df_meta = df.with_columns(pl.col(DatabaseKeys.KEY_METADATA).str.json_decode(dtype=pl.Struct(METADATA_SCHEMA)).alias("meta"))
+        # Extract the level once instead of per filter expression
+        df_meta = df_meta.with_columns(pl.col("meta").struct.field(MetadataKeys.LEVEL).alias("meta_level"))
 
-        max_level = df_meta.select(pl.col("meta").struct.field("level").max()).item()
+        max_level = df_meta.select(pl.col("meta_level").max()).item()
 
         # Only proceed if we have levels deeper than 1
         if max_level is not None and max_level > 1:
@@ -474,9 +474,9 @@ def render_chunks(output_name: str) -> None:
                 group_keys.append("h2")
 
             # Partition data
-            grandparents = df_meta.filter(pl.col("meta").struct.field("level") < parent_level)
-            parents = df_meta.filter(pl.col("meta").struct.field("level") == parent_level)
-            children = df_meta.filter(pl.col("meta").struct.field("level") == max_level)
+            grandparents = df_meta.filter(pl.col("meta_level") < parent_level)
+            parents = df_meta.filter(pl.col("meta_level") == parent_level)
+            children = df_meta.filter(pl.col("meta_level") == max_level)
 
             if not children.is_empty():
                 # Extract grouping keys for join
@@ -566,21 +566,20 @@ def render_chunks(output_name: str) -> None:
             edited_text = editor(text_to_edit=original_text, language="latex", key=editor_key, height=800)
             edited_text  # noqa
 
+            # unique_id is the row position in the payload DataFrame - edit/delete exactly that row
+            row_idx = row["unique_id"]
+
             if action_cols[0].button("Save", key=f"save_btn_{unique_key_suffix}"):
                 current_df = st.session_state.rag_ingestion_payload[output_name].df
-                updated_df = current_df.with_columns(
-                    pl.when(pl.col(DatabaseKeys.KEY_TITLE) == row[DatabaseKeys.KEY_TITLE])
-                    .then(pl.lit(edited_text))
-                    .otherwise(pl.col(DatabaseKeys.KEY_TXT_RETRIEVAL))
-                    .alias(DatabaseKeys.KEY_TXT_RETRIEVAL)
-                )
+                updated_txt = current_df.get_column(DatabaseKeys.KEY_TXT_RETRIEVAL).scatter(row_idx, edited_text)
+                updated_df = current_df.with_columns(updated_txt)
                 st.session_state.rag_ingestion_payload[output_name].df = updated_df
                 st.session_state.is_chunk_edit_mode_active[unique_key_suffix] = False
                 st.rerun()  # Rerun to reflect changes and exit edit mode
 
             if action_cols[1].button("Delete", key=f"delete_btn_{unique_key_suffix}"):
                 current_df = st.session_state.rag_ingestion_payload[output_name].df
-                updated_df = current_df.filter(pl.col(DatabaseKeys.KEY_TITLE) != row[DatabaseKeys.KEY_TITLE])
+                updated_df = pl.concat([current_df.slice(0, row_idx), current_df.slice(row_idx + 1)])
                 st.session_state.rag_ingestion_payload[output_name].df = updated_df
                 st.rerun()  # Rerun to reflect the deletion
         else:
@@ -593,19 +592,37 @@ def render_chunks(output_name: str) -> None:
         pl.col(DatabaseKeys.KEY_METADATA).str.json_decode(dtype=pl.Struct(METADATA_SCHEMA))
     ).unnest(DatabaseKeys.KEY_METADATA)
 
-    level_1_df = chunks_with_metadata.filter(pl.col("level") == 1)
-    level_2_df = chunks_with_metadata.filter(pl.col("level") == 2)
-    level_3_df = chunks_with_metadata.filter(pl.col("level") == 3)
-
-    for l1_row in level_1_df.to_dicts():
+    # Partition rows by level & group children by their parent headings in a single pass
+    level_1_rows: list[dict] = []
+    l2_rows_by_h1: dict[str, list[dict]] = defaultdict(list)
+    l3_rows_by_h2: dict[tuple[str, str], list[dict]] = defaultdict(list)
+    for chunk_row in chunks_with_metadata.to_dicts():
+        if chunk_row["level"] == 1:
+            level_1_rows.append(chunk_row)
+        elif chunk_row["level"] == 2:
+            l2_rows_by_h1[chunk_row["h1"]].append(chunk_row)
+        elif chunk_row["level"] == 3:
+            l3_rows_by_h2[(chunk_row["h1"], chunk_row["h2"])].append(chunk_row)
+
+    def show_children(row: dict, children: list[dict]) -> bool:
+        """Expanders always execute their body - only build child widgets once the user opts in."""
+        if not children:
+            return False
+        return st.toggle(f"Show subsections ({len(children)})", key=f"show_children_{output_name}_{row['unique_id']}")
+
+    for l1_row in level_1_rows:
         with st.expander(f"{l1_row['h1']}"):
             render_chunk(l1_row)
-            l2_children = level_2_df.filter(pl.col("h1") == l1_row["h1"])
-            for l2_row in l2_children.to_dicts():
+            l2_children = l2_rows_by_h1.get(l1_row["h1"], [])
+            if not show_children(l1_row, l2_children):
+                continue
+            for l2_row in l2_children:
                 with st.expander(f"{l2_row['h2']}"):
                     render_chunk(l2_row)
-                    l3_children = level_3_df.filter(pl.col("h2") == l2_row["h2"])
-                    for l3_row in l3_children.to_dicts():
+                    l3_children = l3_rows_by_h2.get((l2_row["h1"], l2_row["h2"]), [])
+                    if not show_children(l2_row, l3_children):
+                        continue
+                    for l3_row in l3_children:
                         with st.expander(f"{l3_row['h3']}"):
                             render_chunk(l3_row)
 
@@ -1,7 +1,9 @@
 import os
 from pathlib import Path
+import re
 from typing import Tuple
 
+import polars as pl
 from rag_database.dataclasses import RAGIngestionPayload, RAGQuery
 from rag_database.rag_config import MODEL_CONFIG, DatabaseKeys
 from rag_database.rag_database import RagDatabase
@@ -17,11 +19,19 @@ from lib.streamlit_helper import nyan_cat_spinner
 from llm_config import DEFAULT_EMBEDDING_MODEL
 
 DATABASE_LABEL_OBSIDIAN = "obsidian"
+DATABASE_PREVIEW_ROWS = 200
+RAG_RESPONSE_CACHE_SIZE = 512
+# <label>_<embedding model without provider prefix>.parquet - the label is matched lazily,
+# so if several model names fit a file name, the shortest label wins
+EMBEDDING_FILE_PATTERN = re.compile(r"^(.+?)_(" + "|".join(re.escape(m.split("/")[1]) for m in MODEL_CONFIG) + r")\.parquet$")
 
 def init_rag_workspace() -> None:
     """Initialize RAG workspace session state variables."""
     if "rag_databases" not in st.session_state:
         st.session_state.rag_databases = {}
+    if "rag_response_cache" not in st.session_state:
+        # (label, model, prompt, k) -> retrieved documents - cleared whenever a database is (re)initialized
+        st.session_state.rag_response_cache = {}
 
 def load_rag_database(rag_db: RagDatabase, payload: RAGIngestionPayload,) -> RagDatabase:
     """Generate a RAG database from a payload parquet file or RAGIngestionPayload."""
@@ -62,6 +72,7 @@ def load_parquet_data(payload_path: Path, embedding_path: Path, selection: str,
     return rag_db, payload
 
 def obsidian_dataloader(model: str) -> Tuple[RagDatabase, RAGIngestionPayload]:
+    """Load the obsidian RAG Database & a payload of all vault documents not yet contained in it."""
     doc_path = Path(f"{DIRECTORY_OBSIDIAN_VAULT}/{DIRECTORY_OBSIDIAN_DOCS}/")
     embedding_path = Path(f"{DIRECTORY_EMBEDDINGS}/{DATABASE_LABEL_OBSIDIAN}_{model}_embeddings.parquet")
     titles = []
@@ -84,13 +95,27 @@ def obsidian_dataloader(model: str) -> Tuple[RagDatabase, RAGIngestionPayload]:
                 texts.append(text)
                 titles.append(doc)
 
-    metadata = []
-    for i in range(len(titles)):
-        meta = {"source": titles[i], "length": len(texts[i])}
-        metadata.append(meta)
+    # Collect all new documents into one payload - embedded in a single add_documents call by load_rag_database
+    metadata = [{"source": title, "length": len(text)} for title, text in zip(titles, texts, strict=True)]
+    payload = RAGIngestionPayload.from_lists(titles=titles, texts=texts, metadata=metadata)
+    return rag_db, payload
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _scan_directory(directory: str, mtime_ns: int) -> tuple[tuple[str, bool], ...]:  # noqa: ARG001
+    """List (name, is_dir) entries of *directory* - *mtime_ns* only keys the cache to the last change of its entries."""
+    with os.scandir(directory) as entries:
+        return tuple((e.name, e.is_dir()) for e in entries)
+
+def _list_directory(directory: str) -> tuple[tuple[str, bool], ...]:
+    """Return the cached entries of *directory* - a single stat per rerun instead of a full listing."""
+    return _scan_directory(directory, os.stat(directory).st_mtime_ns)
 
-        payload = RAGIngestionPayload.from_lists(titles=titles, texts=texts, metadata=metadata)
-        rag_db.add_documents(payload=payload, task_type="RETRIEVAL_DOCUMENT")
+def _database_preview(database: pl.DataFrame) -> pl.DataFrame:
+    """Return the first rows of *database* without embedding vectors - they dominate serialization to the browser."""
+    preview = database.head(DATABASE_PREVIEW_ROWS)
+    return preview.select(
+        [name for name, dtype in preview.schema.items() if not (isinstance(dtype, (pl.List, pl.Array)) and dtype.inner.is_numeric())]
+    )
 
 def rag_sidebar() -> None:
     """RAG Workspace Sidebar for RAG Database selection & initialization."""
@@ -103,49 +128,50 @@ def rag_sidebar() -> None:
             index=list(MODEL_CONFIG.keys()).index(DEFAULT_EMBEDDING_MODEL),
         )
 
-        available_database_payloads = os.listdir(DIRECTORY_RAG_INPUT)
-        available_database_embeddings = os.listdir(DIRECTORY_EMBEDDINGS)
+        available_database_payloads = [name for name, is_dir in _list_directory(DIRECTORY_RAG_INPUT) if is_dir]
+        # truncate _<embedding_model>.parquet to receive the database label
+        unique_database_labels = {
+            m.group(1) for name, _ in _list_directory(DIRECTORY_EMBEDDINGS) if (m := EMBEDDING_FILE_PATTERN.match(name))
+        }
 
-        # for all available database embeddings check for all embedding models if they are contained as string & try to trunctate _<embedding_model>.parquet to receive the label # noqa
-        unique_database_labels = set()
-        for embedding_file in available_database_embeddings:
-            for model_name in MODEL_CONFIG:
-                # remove provider prefix
-                suffix = f"_{model_name.split("/")[1]}.parquet"
-                if embedding_file.endswith(suffix):
-                    unique_database_labels.add(embedding_file.removesuffix(suffix))
-                    break
-
-        available_database_embeddings = sorted(unique_database_labels)
-        options = set(available_database_payloads + available_database_embeddings)
+        # Deterministic order & preserved selection - a bare set reorders options and shifts index=0 between reruns
+        options = sorted(set(available_database_payloads) | unique_database_labels)
+        previous_selection = st.session_state.get("selected_rag_database")
 
         st.session_state.selected_rag_database = st.selectbox(
             "Select RAG Database",
             options=options,
-            index=0,
+            index=options.index(previous_selection) if previous_selection in options else 0,
         )
+        force_reload = st.checkbox("Reload if already in memory", value=False, key="force_reload_rag_db")
         if st.button("Initialize RAG Database", key="load_rag_db"):
-            with nyan_cat_spinner():
-                selection = st.session_state.selected_rag_database
-                model = st.session_state.selected_embedding_model
-                model_without_prefix = model.split("/")[1]
-
-                if selection == DATABASE_LABEL_OBSIDIAN:
-                    rag_db, payload = obsidian_dataloader(model=model)
-                else:
-                    payload_path = Path(f"{DIRECTORY_RAG_INPUT}/{selection}/{selection}_ingestion_payload.parquet")
-                    embedding_path = Path(f"{DIRECTORY_EMBEDDINGS}/{selection}_{model_without_prefix}.parquet")
-                    rag_db, payload = load_parquet_data(
-                        payload_path=payload_path,
-                        embedding_path=embedding_path,
-                        selection=selection,
-                        model=model)
-
-                rag_db = load_rag_database(rag_db=rag_db, payload=payload)
-
-            # Create nested dictionary structure to allow different embeddings for the same documents - will be used for benchmarking
-            st.session_state.rag_databases.setdefault(selection, {})
-            st.session_state.rag_databases[selection][model_without_prefix] = rag_db
+            selection = st.session_state.selected_rag_database
+            model = st.session_state.selected_embedding_model
+            model_without_prefix = model.split("/")[1]
+
+            # Loading parquet & embedding missing documents is expensive - reuse databases already in memory
+            if not force_reload and model_without_prefix in st.session_state.rag_databases.get(selection, {}):
+                st.info(f"RAG Database '{selection}' with model '{model_without_prefix}' is already in memory.")
+            else:
+                with nyan_cat_spinner():
+                    if selection == DATABASE_LABEL_OBSIDIAN:
+                        rag_db, payload = obsidian_dataloader(model=model)
+                    else:
+                        payload_path = Path(f"{DIRECTORY_RAG_INPUT}/{selection}/{selection}_ingestion_payload.parquet")
+                        embedding_path = Path(f"{DIRECTORY_EMBEDDINGS}/{selection}_{model_without_prefix}.parquet")
+                        rag_db, payload = load_parquet_data(
+                            payload_path=payload_path,
+                            embedding_path=embedding_path,
+                            selection=selection,
+                            model=model)
+
+                    rag_db = load_rag_database(rag_db=rag_db, payload=payload)
+
+                # Create nested dictionary structure to allow different embeddings for the same documents
+                # - will be used for benchmarking
+                st.session_state.rag_databases.setdefault(selection, {})
+                st.session_state.rag_databases[selection][model_without_prefix] = rag_db
+                st.session_state.rag_response_cache.clear()
 
         with st.expander("RAG Databases in Memory", expanded=True):
 
@@ -153,7 +179,8 @@ def rag_sidebar() -> None:
                 with st.expander(f"**Label**:{label}", expanded=True):
                     for model, rag_db in models_dict.items():
                         with st.expander(f"**Model**:{model}", expanded=False):
-                            st.dataframe(rag_db.vector_db.database)
+                            if st.checkbox("Preview Database", key=f"preview_rag_db_{label}_{model}"):
+                                st.dataframe(_database_preview(rag_db.vector_db.database), hide_index=True)
                             if st.button("Store Database", key=f"store_rag_db_{label}_{model}"):
                                 parquet_embeddings = f"{DIRECTORY_EMBEDDINGS}/{label}_{model}.parquet"
                                 rag_db.vector_db.database.write_parquet(parquet_embeddings) # noqa
@@ -170,14 +197,32 @@ def rag_workspace() -> None:
         prompt = st.chat_input("Send a message", key="chat_input")
 
     if prompt:
-        rag_db: RagDatabase = st.session_state.rag_databases[st.session_state.selected_rag_database][st.session_state.selected_embedding_model.split("/")[1]] # noqa
-        query = RAGQuery(query=prompt, k_documents=st.session_state.k_query_documents)
-        rag_response = rag_db.rag_process_query(rag_query=query)
+        label = st.session_state.selected_rag_database
+        model = st.session_state.selected_embedding_model.split("/")[1]
+        k_documents = st.session_state.k_query_documents
+        cache_key = (label, model, prompt, k_documents)
+        cache = st.session_state.rag_response_cache
+
+        # Repeated prompts skip query embedding & vector search entirely
+        documents = cache.get(cache_key)
+        if documents is None:
+            rag_db: RagDatabase = st.session_state.rag_databases[label][model]
+            query = RAGQuery(query=prompt, k_documents=k_documents)
+            # Materialize only the displayed columns once - rows are cached as plain dicts
+            documents = (
+                rag_db.rag_process_query(rag_query=query)
+                .to_polars()
+                .select([DatabaseKeys.KEY_SIMILARITIES, DatabaseKeys.KEY_TITLE, DatabaseKeys.KEY_TXT_RETRIEVAL])
+                .to_dicts()
+            )
+            if len(cache) >= RAG_RESPONSE_CACHE_SIZE:
+                cache.pop(next(iter(cache)))  # evict oldest entry
+            cache[cache_key] = documents
+
         with st.chat_message("user"):
             st.markdown(prompt)
         with st.chat_message("assistant"):
-            documents = rag_response.to_polars()
-            for doc in documents.iter_rows(named=True):
+            for doc in documents:
                 with st.expander(f"**Similarity**: {doc[DatabaseKeys.KEY_SIMILARITIES]:.2f}   -  **Title**: {doc[DatabaseKeys.KEY_TITLE]}"): # noqa
                     st.markdown(doc[DatabaseKeys.KEY_TXT_RETRIEVAL])
 